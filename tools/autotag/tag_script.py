@@ -11,7 +11,11 @@ import argparse
 from github import Github, NamedUser
 from packaging.version import Version
 
-from util.release_data import ReleaseBundleFactory, ReleaseDataFactory
+from util.release_data import (
+    ReleaseBundleFactory,
+    ReleaseDataFactory,
+    create_pulls_parallel,
+)
 from util.changelog import Changelog
 from util.util import get_yn_input
 from util import PROCESSORS, TEMPLATES
@@ -213,6 +217,9 @@ def run_tagging():
         else:
             raise error
 
+    # Request the largest page size to reduce the number of paginated calls.
+    gh_args["per_page"] = pr_args["per_page"] = 100
+
     if args.github_url != "github.com":
         gh_args["base_url"] = pr_args[
             "base_url"
@@ -232,7 +239,8 @@ def run_tagging():
         Github(**gh_args), Github(**pr_args),
         "ROCm",
         remote_map,
-        args.branch
+        args.branch,
+        client_args=gh_args,
     )
 
     # Find all the math libraries and their remotes.
@@ -288,24 +296,35 @@ def run_tagging():
     )
 
     # In the last release...
-    libraries = releases[max(releases, key=lambda v: Version(v))].libraries
-    for data in libraries.values():
+    latest = releases[max(releases, key=lambda v: Version(v))]
+    released = []
+    for data in latest.libraries.values():
         try:
             print(f"{data.name} commit revision = {data.commit}")
             print(
                 "Commit Link: "
                 f"https://github.com/{data.qualified_repo}/commit/{data.commit}"
             )
-
-            # Create a PR (rocm-x.x.x -> develop) to bring hotfixes into develop.
             data.do_release(args.release)
-            pr = data.do_create_pull(args.pulls, pr_args["login_or_token"])
-            if pr is not None:
-                if isinstance(data_factory.gh.get_user(), NamedUser.NamedUser):
-                    pr.create_review_request([data_factory.gh.get_user().name])
+            released.append(data)
         except Exception as err:
             print(f"Encountered error tagging {data.name}: {err}")
 
+    # Create PRs (rocm-x.x.x -> develop) to bring hotfixes into develop.
+    pr_token = pr_args.get("login_or_token")
+    pulls = {}
+    if args.pulls is not False:
+        if pr_token is None:
+            print("Skipping pull requests, no GitHub token is available.")
+        else:
+            pulls = create_pulls_parallel(released, args.pulls, pr_token)
+    for name, pr in pulls.items():
+        try:
+            if isinstance(data_factory.gh.get_user(), NamedUser.NamedUser):
+                pr.create_review_request([data_factory.gh.get_user().name])
+        except Exception as err:
+            print(f"Encountered error requesting review for {name}: {err}")
+
     if failed:
         print("Error processing the following libraries:", file=sys.stderr)
         for ver, lib in failed:
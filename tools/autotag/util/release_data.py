@@ -1,33 +1,136 @@
 """Class to store data about a particular release."""
 
+import bisect
+import functools
+import hashlib
+import json
 import os
 import re
-import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple, Union
-
-from git import Repo
-from git.cmd import Git
-from github import Github, UnknownObjectException
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+from git import PushInfo, Repo
+from github import (
+    Github,
+    GithubException,
+    RateLimitExceededException,
+    UnknownObjectException,
+)
 from github.NamedUser import NamedUser
 from github.Organization import Organization
+from github.PullRequest import PullRequest
 from github.Repository import Repository
 from packaging.version import Version
 
 from util.util import get_yn_input
 from util.mappings import category_mapping, group_mapping
 
+_ROCM_TAG_RE = re.compile(r"rocm-(?P<rocm_ver>\d+(?:\.\d+)+)")
+
+
+def _pad_version(version: str) -> str:
+    """Pad a version string to at least major.minor.patch."""
+    parts = version.split(".")
+    if len(parts) >= 3:
+        return version
+    return ".".join(parts + ["0"] * (3 - len(parts)))
+
+
+@functools.lru_cache(maxsize=512)
+def _cached_version(version: str) -> Version:
+    """Parse a version string, reusing previously parsed versions."""
+    return Version(version)
+
+
+TAG_CACHE_DIR = Path.home() / ".cache" / "rocm-autotag" / "tags"
+"""The directory where the fetched tags of each repository are cached."""
+
+TAG_CACHE_TTL = 3600
+"""The number of seconds a cached tag list stays valid."""
+
+
+def _tag_cache_path(url: str) -> Path:
+    """Get the tag cache file for a Git URL."""
+    return TAG_CACHE_DIR / f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+
+
+def _load_cached_tags(url: str) -> Optional[Dict[Version, str]]:
+    """Load the cached version-sha map of a Git URL, if still valid."""
+    cache_path = _tag_cache_path(url)
+    try:
+        if time.time() - cache_path.stat().st_mtime > TAG_CACHE_TTL:
+            return None
+        with cache_path.open(encoding="utf-8") as cache_file:
+            cached = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+    return {_cached_version(version): sha for version, sha in cached.items()}
+
+
+def _store_cached_tags(url: str, tags: Dict[Version, str]):
+    """Atomically write the version-sha map of a Git URL to the cache."""
+    cache_path = _tag_cache_path(url)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=cache_path.parent, delete=False
+        ) as cache_file:
+            try:
+                json.dump(
+                    {str(version): sha for version, sha in tags.items()}, cache_file
+                )
+                cache_file.close()
+                os.replace(cache_file.name, cache_path)
+            except BaseException:
+                # Do not leave the partial file behind in the cache directory.
+                cache_file.close()
+                os.unlink(cache_file.name)
+                raise
+    except OSError as err:
+        print(f"Could not cache the tags of {url}: {err}")
+
+
+def _forget_cached_tags(url: str):
+    """Remove the cached version-sha map of a Git URL."""
+    try:
+        _tag_cache_path(url).unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as err:
+        print(f"Could not clear the cached tags of {url}: {err}")
+
+
+def _is_rate_limited(err: GithubException) -> bool:
+    """Whether a Github error is a primary or secondary rate limit."""
+    if isinstance(err, RateLimitExceededException) or err.status == 429:
+        return True
+    message = err.data.get("message", "") if isinstance(err.data, dict) else ""
+    return err.status == 403 and "rate limit" in message.lower()
+
+
+def _retry_github(func, *args, attempts: int = 4, **kwargs):
+    """Call a Github API function, backing off 1s, 2s, 4s when rate limited."""
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except GithubException as err:
+            if not _is_rate_limited(err) or attempt == attempts - 1:
+                raise
+            time.sleep(2**attempt)
 
-@dataclass
+
+@dataclass(slots=True)
 class ReleaseData:
     """Store Github data for a release."""
 
-    message: str = ""
-    notes: str = ""
     changes: Dict[str, str] = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(slots=True)
 class ReleaseLib:
     """Store data about a release for a particular library."""
 
@@ -35,7 +138,10 @@ class ReleaseLib:
     repo: Optional[Repository] = None
     pr_repo: Optional[Repository] = None
     data: ReleaseData = field(default_factory=ReleaseData)
+    message: str = ""
+    notes: str = ""
     commit: str = ""
+    is_tagged: bool = False
     rocm_version: str = ""
     lib_version: str = ""
     group: str = ""
@@ -60,11 +166,7 @@ class ReleaseLib:
     @property
     def full_version(self) -> str:
         """The ROCm full version of this release."""
-        return (
-            self.rocm_version
-            if self.rocm_version.count(".") > 1
-            else self.rocm_version + ".0"
-        )
+        return _pad_version(self.rocm_version)
 
     @property
     def release_url(self) -> str:
@@ -81,68 +183,79 @@ class ReleaseLib:
         """The GitHub repository URL."""
         return f"https://github.com/ROCm/{self.qualified_repo}"
 
-    @property
-    def message(self) -> str:
-        """Get the Github release message."""
-        return self.data.message
-
-    @message.setter
-    def message(self, value: str):
-        """Set the Github release message."""
-        self.data.message = value
-
-    @property
-    def notes(self) -> str:
-        """Get the Github release notes."""
-        return self.data.notes
-
-    @notes.setter
-    def notes(self, value: str):
-        """Set the Github release notes."""
-        self.data.notes = value
-
     def do_release(self, release_yn: Optional[bool]):
         """Perform the tag and release."""
         print(f"Repo: {self.qualified_repo}")
         print(f"Tag Version: '{self.tag}'")
-        print(f"Release Message: '{self.data.message}'")
-        print(f"Release Notes:\n{self.data.notes}")
+        print(f"Release Message: '{self.message}'")
+        print(f"Release Notes:\n{self.notes}")
         print(f"Release Commit: '{self.commit}'")
         if get_yn_input("Would you like to create this tag and release?", release_yn):
             try:
-                print("Performing tag and release.")
-                release = self.repo.create_git_tag_and_release(
-                    self.tag,
-                    self.data.message,
-                    self.data.message,
-                    self.data.notes,
-                    self.commit,
-                    "commit",
-                )
-                if self.rocm_version != self.full_version:
-                    self.repo.create_git_tag(
-                        f"rocm-{self.rocm_version}",
-                        self.data.message,
+                if self.is_tagged:
+                    # A tag already points at this commit, only the release
+                    # may be missing.
+                    print("Performing release.")
+                    release = self.repo.create_git_release(
+                        self.tag,
+                        self.message,
+                        self.notes,
+                        target_commitish=self.commit,
+                    )
+                else:
+                    print("Performing tag and release.")
+                    release = self.repo.create_git_tag_and_release(
+                        self.tag,
+                        self.message,
+                        self.message,
+                        self.notes,
                         self.commit,
                         "commit",
                     )
+                    if self.rocm_version != self.full_version:
+                        self.repo.create_git_tag(
+                            f"rocm-{self.rocm_version}",
+                            self.message,
+                            self.commit,
+                            "commit",
+                        )
                 print(release.html_url)
-            except Exception:
+            except GithubException as err:
+                if err.status != 422:
+                    raise
                 print(f"Already released {self.name}")
+            finally:
+                if not self.is_tagged:
+                    # New tags may exist now, so a rerun must not see the
+                    # tag list cached before this release.
+                    _forget_cached_tags(self.repo.clone_url)
 
     def do_create_pull(self, create_pull_yn: Optional[bool], token: str):
         """Create a pull request to the internal repository."""
-        if not get_yn_input(
+        if not self.confirm_create_pull(create_pull_yn):
+            return
+        self.push_release_branch(token)
+        return self.open_pull()
+
+    def confirm_create_pull(self, create_pull_yn: Optional[bool]) -> bool:
+        """Ask whether to create a pull request to the internal repository."""
+        return get_yn_input(
             "Do you want to create a pull request from this release to"
             f" {self.pr_repo.full_name}:develop?",
             create_pull_yn,
-        ):
-            return
-        repo_loc = os.path.join(os.getcwd(), self.name)
-        if os.path.isdir(repo_loc):
-            shutil.rmtree(repo_loc)
+        )
 
-        with Repo.init(repo_loc) as local:
+    def push_release_branch(self, token: str):
+        """Push the release commit to the release branch of the bot's fork.
+
+        This only runs git, so unlike the Github calls it is safe to run
+        from several threads at once.
+        """
+        with tempfile.TemporaryDirectory(
+            prefix=f"autotag-{self.name}-"
+        ) as repo_loc, Repo.init(repo_loc) as local:
+            # The fork may lack the history behind the release commit, so the
+            # pushed branch needs the full history of the external repo.
             external = local.create_remote("external", self.repo.clone_url)
             external.fetch()
             fork = local.create_remote(
@@ -150,19 +263,26 @@ class ReleaseLib:
                 f"https://{token}@github.com/"
                 f"ROCmMathLibrariesBot/{self.pr_repo.name}",
             )
-            fork.fetch()
+            fork.fetch(depth=1)
 
             local.create_head("release", self.commit).checkout()
-            fork.push(f"refs/heads/release:refs/heads/{self.branch}")
-        shutil.rmtree(repo_loc)
+            for info in fork.push(f"refs/heads/release:refs/heads/{self.branch}"):
+                if info.flags & PushInfo.ERROR:
+                    raise RuntimeError(
+                        f"Could not push {self.branch} to {fork.name}:"
+                        f" {info.summary.strip()}"
+                    )
 
+    def open_pull(self) -> PullRequest:
+        """Open a pull request from the pushed release branch to develop."""
         pr_title = f"Hotfixes from {self.branch} at release {self.full_version}"
         pr_body = (
             "This is an autogenerated PR.\n This is intended to pull any"
             f" hotfixes for ROCm release {self.full_version} (including"
             " changelogs and documentation) back into develop."
         )
-        pr = self.pr_repo.create_pull(
+        pr = _retry_github(
+            self.pr_repo.create_pull,
             title=pr_title,
             body=pr_body,
             head=f"ROCmMathLibrariesBot:{self.branch}",
@@ -175,7 +295,7 @@ class ReleaseLib:
 class ReleaseDataFactory:
     """A factory for ReleaseData objects."""
 
-    lib_versions: Dict[str, str] = {}
+    lib_versions: Dict[str, str]
     """A map of commit hashes to lib versions."""
 
     def __init__(
@@ -184,6 +304,7 @@ class ReleaseDataFactory:
         self.gh: Github = gh
         self.pr_gh: Github = pr_gh
         self.rocm_version: Version = version
+        self.lib_versions = {}
         if org_name is None:
             self.org = self.pr_org = None
         else:
@@ -233,12 +354,45 @@ class ReleaseDataFactory:
         return data
 
 
-@dataclass
+def create_pulls_parallel(
+    libraries: List[ReleaseLib],
+    create_pull_yn: Optional[bool],
+    token: str,
+    max_workers: int = 6,
+) -> Dict[str, PullRequest]:
+    """Create the pull requests of the libraries, pushing concurrently."""
+    # Prompt for every library first, only the git pushes are farmed out to
+    # the workers. The Github clients are not thread-safe, so the pull
+    # requests are opened from this thread as the pushes finish.
+    confirmed = []
+    for lib in libraries:
+        try:
+            if lib.confirm_create_pull(create_pull_yn):
+                confirmed.append(lib)
+        except Exception as err:
+            print(f"Encountered error creating pull for {lib.name}: {err}")
+
+    pulls = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(lib.push_release_branch, token): lib for lib in confirmed
+        }
+        for future in as_completed(futures):
+            lib = futures[future]
+            try:
+                future.result()
+                pulls[lib.name] = lib.open_pull()
+            except Exception as err:
+                print(f"Encountered error creating pull for {lib.name}: {err}")
+    return pulls
+
+
+@dataclass(slots=True)
 class ReleaseBundle:
     """Stores data about all the libraries bundled in this release."""
 
     version: str = ""
-    libraries: Dict[str, ReleaseLib] = field(default_factory=ReleaseLib)
+    libraries: Dict[str, ReleaseLib] = field(default_factory=dict)
 
 
 class ReleaseBundleFactory:
@@ -249,20 +403,29 @@ class ReleaseBundleFactory:
     default_remote: str = ""
     """The default fallback remote."""
 
-    remotes: Dict[str, str] = {}
+    remotes: Dict[str, str]
     """A dictionary translating the manifest remote shorthand to the full name."""
 
-    tags: Dict[str, Dict[Version, str]] = {}
-    """A dictionary with all the ROCm version numbers and commit sha for each library."""
+    tags: Dict[str, Dict[Version, str]]
+    """A dictionary with all the ROCm version numbers and commit sha for each library.
+
+    The tags of the main ROCm repository are stored under its full name.
+    """
 
     orgs_and_users: Dict[
         str, Tuple[Union[NamedUser, Organization], Union[NamedUser, Organization]]
-    ] = {}
+    ]
     """A dictionary containing the base and PR user or organization for each project."""
 
-    pr_repos: Dict[str, Tuple[Repo, Repo]] = {}
+    _org_repo_names: Dict[str, Set[str]]
+    """A dictionary containing the lowercase PR repo names of each organization."""
+
+    pr_repos: Dict[str, Tuple[Repo, Repo]]
     """A dictionary containing the base and PR repo for each project."""
 
+    client_args: Optional[Dict[str, Any]]
+    """The arguments to create a Github client, used to give each worker its own."""
+
     def __init__(
         self,
         rocm_repo: str,
@@ -271,15 +434,23 @@ class ReleaseBundleFactory:
         default_remote: str,
         remotes: Dict[str, str],
         branch: Optional[str],
+        client_args: Optional[Dict[str, Any]] = None,
     ):
         # Store Github data
         self.gh = gh
         self.pr_gh = pr_gh
+        self.client_args = client_args
 
         self.default_remote = default_remote
         self.remotes = remotes
         self.branch = branch
 
+        # Caches, filled as the libraries are looked up.
+        self.tags = {}
+        self.orgs_and_users = {}
+        self._org_repo_names = {}
+        self.pr_repos = {}
+
         # Get the main repository:
         self.rocm_repo = gh.get_repo(rocm_repo)
 
@@ -305,6 +476,12 @@ class ReleaseBundleFactory:
                     raise ValueError(
                         f"Could not find organization/user {remote}."
                     ) from err
+            # Only organizations list the private repos visible to the
+            # token, so users keep probing for the internal repo instead.
+            if isinstance(pr_ns, Organization):
+                self._org_repo_names[remote] = {
+                    repo.name.lower() for repo in pr_ns.get_repos(type="all")
+                }
             self.orgs_and_users[remote] = (gh_ns, pr_ns)
 
         return self.orgs_and_users[remote]
@@ -317,10 +494,14 @@ class ReleaseBundleFactory:
             gh_ns, pr_ns = self.get_org_or_user(org)
             repo = gh_ns.get_repo(name)
             print(f"  Repo: {repo.url}")
-            try:
-                pr_repo = pr_ns.get_repo(name + "-internal")
-            except UnknownObjectException:
+            repo_names = self._org_repo_names.get(org)
+            if repo_names is not None and f"{name}-internal".lower() not in repo_names:
                 pr_repo = pr_ns.get_repo(name)
+            else:
+                try:
+                    pr_repo = pr_ns.get_repo(name + "-internal")
+                except UnknownObjectException:
+                    pr_repo = pr_ns.get_repo(name)
             self.pr_repos[name] = (repo, pr_repo)
 
         return self.pr_repos[name]
@@ -339,28 +520,72 @@ class ReleaseBundleFactory:
         if name not in self.tags:
             print(f"Fetching tags for {name}.")
             repo, _ = self.get_repos(name)
-            self.tags[name] = self.fetch_tags(repo.clone_url)
+            self.tags[name] = self.fetch_tags(repo)
 
         if version not in self.tags[name]:
             return None
 
         return self.tags[name][version]
 
-    def fetch_tags(self, url: str) -> Dict[Version, str]:
-        """Fetches a version-sha map for a given Git URL."""
-        result: Dict[Version, str] = {}
-        for line in Git().ls_remote("--tags", url).split("\n"):
-            column = line.split("\t")
-            sha = column[0]
-            tag = column[1]
+    def _warm_repos(self, component_info: List[Tuple[str, str]]):
+        """Fetches the repos of all the libraries up front."""
+        # The lookups share the Github clients, whose connection is not
+        # thread-safe, so they run serially.
+        for name, remote, *_ in component_info:
+            self.get_repos(name, remote)
+
+    def _warm_tags(self, component_info: List[Tuple[str, str]]):
+        """Fetches the tags of all the libraries, concurrently if possible."""
+        missing = {}
+        for name, remote, *_ in component_info:
+            if name not in self.tags:
+                missing.setdefault(name, remote)
+
+        for name in missing:
+            print(f"Fetching tags for {name}.")
+        repos = [self.get_repos(name, remote)[0] for name, remote in missing.items()]
+
+        # The connection of a Github client is not thread-safe, so without the
+        # arguments to create a client per worker the tags are paged serially.
+        if self.client_args is None:
+            for name, repo in zip(missing, repos):
+                self.tags[name] = self.fetch_tags(repo)
+            return
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            fetched = executor.map(
+                lambda repo: self.fetch_tags(repo, Github(**self.client_args)),
+                repos,
+            )
+            for name, tags in zip(missing, fetched):
+                self.tags[name] = tags
+
+    def fetch_tags(
+        self, repo: Repository, gh: Optional[Github] = None
+    ) -> Dict[Version, str]:
+        """Fetches a version-sha map for a given Github repository.
+
+        If a client is passed, the tags are paged through it instead of the
+        client the repository was fetched with.
+        """
+        url = repo.clone_url
+        cached = _load_cached_tags(url)
+        if cached is not None:
+            return cached
 
-            tag_match = re.search(r"(?P<rocm_tag>rocm-(?P<rocm_ver>\d+(\.\d+)+))", tag)
+        if gh is not None:
+            repo = gh.get_repo(repo.full_name, lazy=True)
+
+        result: Dict[Version, str] = {}
+        for tag in repo.get_tags():
+            tag_match = _ROCM_TAG_RE.fullmatch(tag.name)
             if not tag_match:
                 continue
 
-            rocm_ver = tag_match["rocm_ver"]
-            rocm_ver += ".0" * (2 - rocm_ver.count("."))
-            result[Version(rocm_ver)] = sha
+            rocm_ver = _pad_version(tag_match["rocm_ver"])
+            result[_cached_version(rocm_ver)] = tag.commit.sha
+
+        _store_cached_tags(url, result)
         return result
 
     def create_release_bundle_data(
@@ -377,6 +602,8 @@ class ReleaseBundleFactory:
 
         prev_group = None
         prev_category = None
+        empty_group = group_mapping[""]
+        empty_category = category_mapping[""]
 
         print(f"\nLibraries for rocm-{version}:")
         for name, remote, group, category in component_info:
@@ -384,6 +611,7 @@ class ReleaseBundleFactory:
 
             # Find the tag and otherwise
             commit = self.get_tag(name, version)
+            is_tagged = commit is not None
             if not commit:
                 print(f"- Could not find tag '{tag_name}' in '{name}'")
                 if not is_untagged:
@@ -399,23 +627,26 @@ class ReleaseBundleFactory:
                     continue
 
             if prev_group == group:
-                group = ""
+                group_name = empty_group
             else:
                 prev_group = group
+                group_name = group_mapping[group]
 
             if prev_category == category:
-                category = ""
+                category_name = empty_category
             else:
                 prev_category = category
+                category_name = category_mapping[category]
 
             libraries[name] = ReleaseLib(
                 name=name,
                 repo=repo,
                 pr_repo=pr_repo,
                 commit=commit,
+                is_tagged=is_tagged,
                 rocm_version=str(version),
-                group=group_mapping[group],
-                category=category_mapping[category],
+                group=group_name,
+                category=category_name,
             )
 
             print(f"- {name:11} {commit}")
@@ -435,22 +666,33 @@ class ReleaseBundleFactory:
     ) -> Dict[str, ReleaseBundle]:
         """Create a map of versions and release bundles."""
 
+        # Get the repositories of every library once, up front.
+        self._warm_repos(component_information)
+
         # Get the tags and versions
-        max_version = Version(up_to_version)
-        rocm_tags = self.fetch_tags(self.rocm_repo.clone_url)
+        max_version = _cached_version(up_to_version)
+        min_v = _cached_version(min_version)
+        rocm_name = self.rocm_repo.full_name
+        if rocm_name not in self.tags:
+            self.tags[rocm_name] = self.fetch_tags(self.rocm_repo)
+        rocm_tags = self.tags[rocm_name]
         versions = list(rocm_tags.keys())
 
-        if up_to_version not in versions:
+        if max_version not in versions:
             versions.append(max_version)
         versions.sort()
 
-        # For each ROCm release, create a bundle.
+        # Fetch the tags of every library once, up front.
+        self._warm_tags(component_information)
+
+        # For each ROCm release in the requested range, create a bundle.
+        lo = bisect.bisect_left(versions, min_v)
+        hi = bisect.bisect_right(versions, max_version)
         data = {}
-        for version in versions:
-            if version >= Version(min_version) and version <= max_version:
-                can_be_untagged = version == max_version
-                data[str(version)] = self.create_release_bundle_data(
-                    version, component_information, can_be_untagged
-                )
+        for version in versions[lo:hi]:
+            can_be_untagged = version == max_version
+            data[str(version)] = self.create_release_bundle_data(
+                version, component_information, can_be_untagged
+            )
 
         return data